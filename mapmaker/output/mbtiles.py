@@ -37,12 +37,22 @@ class ExtractionError(Exception):
 #===============================================================================
 
 class MBTiles(object):
+    # Tile insert statement shared by all writes
+    INSERT_TILE = """insert into tiles (zoom_level, tile_column, tile_row, tile_data)
+                                values (?, ?, ?, ?);"""
+
     def __init__(self, filepath, create=False, force=False, silent=False):
         self._silent = silent
         if force and os.path.exists(filepath):
             os.remove(filepath)
         self._connnection = mb.mbtiles_connect(filepath, self._silent)
         self._cursor = self._connnection.cursor()
+        # The tile file is rebuilt from scratch if a run fails, so don't wait for
+        # writes to reach disk and keep the rollback journal and temporary tables
+        # in memory
+        self._cursor.execute('PRAGMA synchronous=OFF;')
+        self._cursor.execute('PRAGMA journal_mode=MEMORY;')
+        self._cursor.execute('PRAGMA temp_store=MEMORY;')
         if create:
             mb.mbtiles_setup(self._cursor)
 
@@ -77,9 +87,7 @@ class MBTiles(object):
 
     def save_tile_as_png(self, zoom, x, y, image):
         output = cv2.imencode('.png', image)[1]
-        self._cursor.execute("""insert into tiles (zoom_level, tile_column, tile_row, tile_data)
-                                           values (?, ?, ?, ?);""",
-                                                  (zoom, x, mb.flip_y(zoom, y), sqlite3.Binary(output))
-                            )
+        self._cursor.execute(self.INSERT_TILE,
+                             (zoom, x, mb.flip_y(zoom, y), sqlite3.Binary(output)))
 
 #===============================================================================
@@ -18,6 +18,8 @@
 #
 #===============================================================================
 
+from functools import lru_cache
+
 from pyparsing import alphanums, nums, printables
 from pyparsing import Combine, delimitedList, Group, Keyword
 from pyparsing import Optional, Suppress, Word, ZeroOrMore
@@ -106,7 +108,21 @@ DEPRECATED_MARKUP = [
 
 #===============================================================================
 
+# Markup strings repeat heavily in large sources so parse each unique string once.
+# Parse results are cached and callers are given a copy that they can modify.
+
+MARKUP_CACHE_SIZE = 4096
+
+#===============================================================================
+
 def parse_layer_directive(s):
+    result = __parse_layer_directive(s)
+    if 'zoom' in result:
+        return {**result, 'zoom': list(result['zoom'])}
+    return dict(result)
+
+@lru_cache(maxsize=MARKUP_CACHE_SIZE)
+def __parse_layer_directive(s):
     result = {}
     try:
         parsed = LAYER_DIRECTIVE.parseString(s, parseAll=True)
@@ -122,6 +138,10 @@ def parse_layer_directive(s):
 #===============================================================================
 
 def parse_markup(markup):
+    return dict(__parse_markup(markup, settings.get('showDeprecated', False)))
+
+@lru_cache(maxsize=MARKUP_CACHE_SIZE)
+def __parse_markup(markup, show_deprecated):
     properties = {'markup': markup}
     deprecated = []
     try:
@@ -139,7 +159,7 @@ def parse_markup(markup):
                 properties[prop[0]] = prop[1]
     except ParseException:
         properties['error'] = 'Syntax error'
-    if len(deprecated) and settings.get('showDeprecated', False):
+    if len(deprecated) and show_deprecated:
         properties['warning'] = "Deprecated '{}'".format("', '".join(deprecated))
     if ('styling' in properties
     and ('id' in properties or 'class' in properties)):
@@ -124,14 +124,14 @@ class FCSlide(Slide):
         if self.__shape_filter is not None:
             if self.kind == 'base':
                 # Add shapes to the filter
-                for shape in self.shapes.flatten(skip=1):
+                for shape in self.shapes.iter_leaves(skip=1):
                     self.__shape_filter.add_shape(shape)
                 # Now create it for use by subsequent layers
                 self.__shape_filter.create_filter()
             elif self.kind == 'layer':
                 # Exclude shapes from the layer if they are similar to those in the base layer.
                 # Excluded shapes have a ``global-shape`` property giving the matching base shape.
-                for shape in self.shapes.flatten(skip=1):
+                for shape in self.shapes.iter_leaves(skip=1):
                     self.__shape_filter.filter(shape)
 
         self.__add_connections()
@@ -149,7 +149,7 @@ class FCSlide(Slide):
             geometries.append(geometry)
 
         outer_geometry = shapely.prepared.prep(self.geometry)
-        for shape in self.shapes.flatten(skip=1):
+        for shape in self.shapes.iter_leaves(skip=1):
             geometry = shape.geometry
             if shape.type == SHAPE_TYPE.FEATURE and 'Polygon' in geometry.geom_type:
                 # We are only interested in features actually on the slide that are
@@ -40,6 +40,11 @@ from .powerpoint import Slide
 
 #===============================================================================
 
+# Saved DrawML can be large so is written in one go through a large buffer
+DRAWML_BUFFER_SIZE = 1 << 20
+
+#===============================================================================
+
 def set_relationship_property(feature, property, relatives):
     geojson_ids = set(s.global_shape.geojson_id for s in relatives if s.global_shape.geojson_id)
     if feature.has_property(property):
@@ -101,7 +106,7 @@ class PowerpointLayer(MapLayer):
                         feature.geojson_id,
                         node_ids)
             # Pass parent/child containment to the viewer
-            for shape in shapes.flatten(skip=1):
+            for shape in shapes.iter_leaves(skip=1):
                 feature = shape.global_shape.get_property('feature')
                 if feature is not None:
                     set_relationship_property(feature, 'children', shape.children)
@@ -109,14 +114,16 @@ class PowerpointLayer(MapLayer):
 
     def __process_shape_list(self, shapes: TreeList) -> list[Feature]:
     #=================================================================
+        # Walk the shape tree with an explicit stack of ``(shape iterator, features)``
+        # frames rather than recursing into groups
         features = []
-        for shape in shapes[1:]:
-            if isinstance(shape, TreeList):
-                group_features = self.__process_shape_list(shape)
-                grouped_feature = self.add_features('Group', group_features)
-                if grouped_feature is not None:
-                    features.append(grouped_feature)
-            else:
+        stack = [(iter(shapes[1:]), features)]
+        while stack:
+            (shape_iter, features) = stack[-1]
+            for shape in shape_iter:
+                if isinstance(shape, TreeList):
+                    stack.append((iter(shape[1:]), []))
+                    break
                 properties = dict(shape.properties)
                 self.source.check_markup_errors(properties)
                 if 'tile-layer' not in properties:
@@ -132,6 +139,12 @@ class PowerpointLayer(MapLayer):
                     features.append(feature)
                     shape.geojson_id = feature.geojson_id
                     shape.set_property('feature', feature)
+            else:
+                stack.pop()
+                if stack:
+                    grouped_feature = self.add_features('Group', features)
+                    if grouped_feature is not None:
+                        stack[-1][1].append(grouped_feature)
         return features
 
 #===============================================================================
@@ -169,8 +182,9 @@ class PowerpointSource(MapSource):
             slide_layer = PowerpointLayer(self, id, slide, n)
             log.info(f'Slide {n}, {slide_layer.id}')
             if settings.get('saveDrawML'):
-                with open(self.flatmap.full_filename(f'{slide_layer.id}.xml'), 'w') as xml:
-                    xml.write(slide.pptx_slide.element.xml)
+                with open(self.flatmap.full_filename(f'{slide_layer.id}.xml'), 'wb',
+                          buffering=DRAWML_BUFFER_SIZE) as xml:
+                    xml.write(slide.pptx_slide.element.xml.encode('utf-8'))
             slide_layer.process()
             self.add_layer(slide_layer)
         if 'exportSVG' in settings:
@@ -19,6 +19,7 @@
 #===============================================================================
 
 import math
+from typing import Optional
 
 #===============================================================================
 
@@ -50,10 +51,14 @@ def segment_as_string(*args):
 
 #===============================================================================
 
-def get_shape_geometry(shape: PptxShape, transform: Transform, properties=None):
+def get_shape_geometry(shape: PptxShape, transform: Transform, properties=None,
+                       shape_transform: Optional[Transform]=None):
 #===============================================================================
 ##
 ## Returns shape's geometry as `shapely` object.
+##
+## ``shape_transform``, if given, is the shape's precomputed ``DrawMLTransform``
+## and is used for paths that don't have their own width and height.
 ##
     closed = False
     coordinates = []
@@ -61,8 +66,11 @@ def get_shape_geometry(shape: PptxShape, transform: Transform, properties=None):
     pptx_geometry = Geometry(shape)
     svg_path = svgelements.Path()
     for path in pptx_geometry.path_list:
-        bbox = (shape.width, shape.height) if path.w is None or path.h is None else (path.w, path.h)
-        T = transform@DrawMLTransform(shape, bbox)
+        if path.w is None or path.h is None:
+            T = transform@(shape_transform if shape_transform is not None
+                            else DrawMLTransform(shape, (shape.width, shape.height)))
+        else:
+            T = transform@DrawMLTransform(shape, (path.w, path.h))
 
         current_point = []
         first_point = None
@@ -57,7 +57,7 @@ from ..fc_powerpoint.components import is_system_name
 from .colour import ColourMap, ColourTheme
 from .geometry import get_shape_geometry
 from .presets import CT_TextMath, DRAWINGML, PPTX_NAMESPACE, pptx_resolve, pptx_uri
-from .transform import DrawMLTransform
+from .transform import drawml_matrices, drawml_parameters
 
 from .omml2latex import openmath2latex
 
@@ -68,6 +68,35 @@ if TYPE_CHECKING:
 
 STROKE_WIDTH_SCALE_FACTOR = 1270.0
 
+# Shapes whose ``xfrm`` element is used when processing a slide
+
+DRAWML_TRANSFORMED_SHAPES = frozenset([
+    MSO_SHAPE_TYPE.AUTO_SHAPE,              # type: ignore
+    MSO_SHAPE_TYPE.FREEFORM,                # type: ignore
+    MSO_SHAPE_TYPE.GROUP,                   # type: ignore
+    MSO_SHAPE_TYPE.LINE,                    # type: ignore
+    MSO_SHAPE_TYPE.PICTURE,                 # type: ignore
+    MSO_SHAPE_TYPE.TEXT_BOX,                # type: ignore
+])
+
+# Shapes whose geometry is extracted from their DrawingML
+
+GEOMETRY_SHAPES = frozenset([
+    MSO_SHAPE_TYPE.AUTO_SHAPE,              # type: ignore
+    MSO_SHAPE_TYPE.FREEFORM,                # type: ignore
+    MSO_SHAPE_TYPE.LINE,                    # type: ignore
+    MSO_SHAPE_TYPE.TEXT_BOX,                # type: ignore
+])
+
+def pptx_shape_type(pptx_shape) -> Optional[MSO_SHAPE_TYPE]:
+#===========================================================
+    # ``shape_type`` is a property that is evaluated on each access and
+    # raises an exception for shapes that `python-pptx` doesn't recognise
+    try:
+        return pptx_shape.shape_type
+    except NotImplementedError:
+        return None
+
 #===============================================================================
 
 # (colour, opacity)
@@ -163,6 +192,18 @@ class Slide:
                                                         self.__transform, show_progress=True))
         return self.__shapes
 
+    def __drawml_transforms(self, pptx_shapes: list, pptx_types: list[Optional[MSO_SHAPE_TYPE]]) -> list[Optional[Transform]]:
+    #=========================================================================================================================
+        # Compute the DrawingML transforms of all shapes in a list in one vectorised pass,
+        # returned in the same order as the shapes
+        transforms: list[Optional[Transform]] = [None]*len(pptx_shapes)
+        indices = [n for n, pptx_type in enumerate(pptx_types) if pptx_type in DRAWML_TRANSFORMED_SHAPES]
+        if len(indices):
+            matrices = drawml_matrices(np.array([drawml_parameters(pptx_shapes[n]) for n in indices]))
+            for n, matrix in zip(indices, matrices):
+                transforms[n] = Transform(matrix)
+        return transforms
+
     def __get_colour(self, shape: PptxConnector | PptxGroupShape | PptxShape,
                      group_colour: Optional[ColourPair]=None) -> ColourPair:
     #=======================================================================
@@ -282,12 +323,12 @@ class Slide:
         text = ' '.join(shape_text)
         return ' '.join(text.split()) if text not in ['', '.'] else ''
 
-    def __process_group(self, group: PptxGroupShape, transform: Transform) -> Shape | TreeList:
-    #==========================================================================================
+    def __process_group(self, group: PptxGroupShape, transform: Transform, group_transform: Transform) -> Shape | TreeList:
+    #=====================================================================================================================
         colour = self.__get_colour(group)
         group_shapes = self.__shapes_as_group(group,
                             self.__process_pptx_shapes(group.shapes,        # type: ignore
-                                transform@DrawMLTransform(group),
+                                transform@group_transform,
                                 group_colour=colour))
         if isinstance(group_shapes, Shape):
             return group_shapes
@@ -317,8 +358,11 @@ class Slide:
             total=len(pptx_shapes),
             unit='shp', ncols=40,
             bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt}')
+        pptx_shapes = list(pptx_shapes)
+        pptx_types = [pptx_shape_type(pptx_shape) for pptx_shape in pptx_shapes]
+        drawml_transforms = self.__drawml_transforms(pptx_shapes, pptx_types)
         shapes = TreeList()
-        for pptx_shape in pptx_shapes:
+        for pptx_shape, pptx_type, drawml_transform in zip(pptx_shapes, pptx_types, drawml_transforms):
             shape_name = pptx_shape.name
             shape_properties = parse_markup(shape_name) if shape_name.startswith('.') else {}
             shape_properties['pptx-shape'] = pptx_shape
@@ -326,22 +370,20 @@ class Slide:
 
             def good_geometry(geometry):
                 if geometry is None:
-                    log.warning(f'Shape "{shape_name}" {pptx_shape.shape_type}/{shape_properties.get("shape-kind")} not processed -- cannot get geometry')
+                    log.warning(f'Shape "{shape_name}" {pptx_type}/{shape_properties.get("shape-kind")} not processed -- cannot get geometry')
                 elif not geometry.is_valid:
-                    log.warning(f'Shape "{shape_name}" {pptx_shape.shape_type}/{shape_properties.get("shape-kind")} not processed -- cannot get valid geometry')
+                    log.warning(f'Shape "{shape_name}" {pptx_type}/{shape_properties.get("shape-kind")} not processed -- cannot get valid geometry')
                 else:
                     return True
                 return False
 
-            if (pptx_shape.shape_type == MSO_SHAPE_TYPE.AUTO_SHAPE              # type: ignore
-             or pptx_shape.shape_type == MSO_SHAPE_TYPE.FREEFORM                # type: ignore
-             or pptx_shape.shape_type == MSO_SHAPE_TYPE.TEXT_BOX                # type: ignore
-             or pptx_shape.shape_type == MSO_SHAPE_TYPE.LINE):                  # type: ignore
+            if pptx_type in GEOMETRY_SHAPES:
                 colour, alpha = self.__get_colour(pptx_shape, group_colour)     # type: ignore
                 shape_properties['colour'] = colour
                 if alpha < 1.0:
                     shape_properties['opacity'] = alpha
-                if good_geometry(geometry := get_shape_geometry(pptx_shape, transform, shape_properties)):
+                if good_geometry(geometry := get_shape_geometry(pptx_shape, transform, shape_properties,
+                                                      drawml_transform)):
                     shape_xml = etree.fromstring(pptx_shape.element.xml)
                     for link_ref in shape_xml.findall('.//a:hlinkClick',
                                                     namespaces=PPTX_NAMESPACE):
@@ -350,7 +392,7 @@ class Slide:
                          and pptx_shape.part.rels[r_id].reltype == pptx_uri('r:hyperlink')):
                             shape_properties['hyperlink'] = pptx_shape.part.rels[r_id].target_ref
                             break
-                    if pptx_shape.shape_type == MSO_SHAPE_TYPE.LINE:            # type: ignore
+                    if pptx_type == MSO_SHAPE_TYPE.LINE:                        # type: ignore
                         ## cf. pptx2svg for stroke colour
                         shape_type = SHAPE_TYPE.CONNECTION
                         if (connection := shape_xml.find('.//p:nvCxnSpPr/p:cNvCxnSpPr',
@@ -374,14 +416,15 @@ class Slide:
                     shape = self.__new_shape(shape_type, pptx_shape.shape_id, geometry, shape_properties)
                     shapes.append(shape)
                 elif geometry is None:
-                    log.warning(f'Shape "{shape_name}" {pptx_shape.shape_type}/{shape_properties.get("shape-kind")} not processed -- cannot get geometry')
+                    log.warning(f'Shape "{shape_name}" {pptx_type}/{shape_properties.get("shape-kind")} not processed -- cannot get geometry')
                 else:
-                    log.warning(f'Shape "{shape_name}" {pptx_shape.shape_type}/{shape_properties.get("shape-kind")} not processed -- cannot get valid geometry')
-            elif pptx_shape.shape_type == MSO_SHAPE_TYPE.GROUP:             # type: ignore
-                shapes.append(self.__process_group(pptx_shape, transform))  # type: ignore
-            elif pptx_shape.shape_type == MSO_SHAPE_TYPE.PICTURE:           # type: ignore
+                    log.warning(f'Shape "{shape_name}" {pptx_type}/{shape_properties.get("shape-kind")} not processed -- cannot get valid geometry')
+            elif pptx_type == MSO_SHAPE_TYPE.GROUP:                         # type: ignore
+                shapes.append(self.__process_group(pptx_shape, transform, drawml_transform))  # type: ignore
+            elif pptx_type == MSO_SHAPE_TYPE.PICTURE:                       # type: ignore
                 shape_type = SHAPE_TYPE.FEATURE
-                if good_geometry(geometry := get_shape_geometry(pptx_shape, transform, shape_properties)):
+                if good_geometry(geometry := get_shape_geometry(pptx_shape, transform, shape_properties,
+                                                      drawml_transform)):
                     shape = self.__new_shape(shape_type, pptx_shape.shape_id, geometry, shape_properties)
                     bbox = geometry.bounds                      # type: ignore
                     image_pos = (bbox[0], bbox[1])
@@ -394,7 +437,7 @@ class Slide:
                     shape.set_property('svg-kind', 'image')
                     shapes.append(shape)
             else:
-                log.warning('Shape "{}" {} not processed...'.format(shape_name, str(pptx_shape.shape_type)))
+                log.warning(f'Shape "{shape_name}" {pptx_type!s} not processed...')
             progress_bar.update(1)
 
         progress_bar.close()
@@ -24,44 +24,154 @@ from math import sin, cos, radians
 
 import numpy as np
 
+# ``numba`` is optional; when present, batches of transforms are computed
+# by a compiled kernel rather than by a sequence of numpy array operations
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
 #===============================================================================
 
 from mapmaker.geometry import Transform
 
 #===============================================================================
 
+def drawml_parameters(shape, bbox=None) -> tuple[float, ...]:
+#============================================================
+    """
+    Get the parameters of a shape's DrawingML ``xfrm`` element, as
+    ``(Bx, By, Dx, Dy, Bx_, By_, Dx_, Dy_, theta, Fx, Fy)``.
+    """
+    if bbox is None:
+        bbox = (shape.width, shape.height)
+
+    xfrm = shape.element.xfrm
+
+    # From Section L.4.7.6 of ECMA-376 Part 1
+    (Bx, By) = ((xfrm.chOff.x, xfrm.chOff.y)
+                    if xfrm.chOff is not None else
+                (0, 0))
+    (Dx, Dy) = ((xfrm.chExt.cx, xfrm.chExt.cy)
+                    if xfrm.chExt is not None else
+                bbox)
+    (Bx_, By_) = (xfrm.off.x, xfrm.off.y)
+    (Dx_, Dy_) = (xfrm.ext.cx, xfrm.ext.cy)
+    theta = radians(xfrm.rot)
+    Fx = -1 if xfrm.flipH else 1
+    Fy = -1 if xfrm.flipV else 1
+    return (Bx, By, Dx, Dy, Bx_, By_, Dx_, Dy_, theta, Fx, Fy)
+
+def drawml_matrices(parameters: np.ndarray) -> np.ndarray:
+#=========================================================
+    """
+    Vectorised form of :class:`DrawMLTransform`.
+
+    :param parameters: An ``(N, 11)`` array, each row as returned by :func:`drawml_parameters`
+    :returns: An ``(N, 3, 3)`` array of transform matrices
+    """
+    parameters = np.asarray(parameters, dtype=np.float64)
+    if __batch_transform is not None:
+        T = np.zeros((len(parameters), 3, 3), dtype=np.float64)
+        __batch_transform(parameters, T)
+        return T
+    (Bx, By, Dx, Dy, Bx_, By_, Dx_, Dy_, theta, Fx, Fy) = parameters.T
+    Sx = np.divide(Dx_, Dx, out=np.ones_like(Dx), where=(Dx != 0))
+    Sy = np.divide(Dy_, Dy, out=np.ones_like(Dy), where=(Dy != 0))
+    Tx = np.where(Dx != 0, Bx_ - Sx*Bx, Bx_)
+    Ty = np.where(Dy != 0, By_ - Sy*By, By_)
+    Cx = Bx_ + Dx_/2.0
+    Cy = By_ + Dy_/2.0
+    cos_t = np.cos(theta)
+    sin_t = np.sin(theta)
+    M00 = Fx*cos_t
+    M01 = -Fy*sin_t
+    M10 = Fx*sin_t
+    M11 = Fy*cos_t
+    T = np.zeros((len(Bx), 3, 3), dtype=np.float64)
+    T[:, 0, 0] = M00*Sx
+    T[:, 0, 1] = M01*Sy
+    T[:, 0, 2] = M00*Tx + M01*Ty + Cx - (M00*Cx + M01*Cy)
+    T[:, 1, 0] = M10*Sx
+    T[:, 1, 1] = M11*Sy
+    T[:, 1, 2] = M10*Tx + M11*Ty + Cy - (M10*Cx + M11*Cy)
+    T[:, 2, 2] = 1.0
+    return T
+
+def __fill_drawml_matrices(parameters, out):
+#===========================================
+    # Straight-line form of ``drawml_matrices()`` for compiling with ``numba``
+    for i in range(parameters.shape[0]):
+        Bx = parameters[i, 0]
+        By = parameters[i, 1]
+        Dx = parameters[i, 2]
+        Dy = parameters[i, 3]
+        Bx_ = parameters[i, 4]
+        By_ = parameters[i, 5]
+        Dx_ = parameters[i, 6]
+        Dy_ = parameters[i, 7]
+        theta = parameters[i, 8]
+        Fx = parameters[i, 9]
+        Fy = parameters[i, 10]
+        if Dx != 0:
+            Sx = Dx_/Dx
+            Tx = Bx_ - Sx*Bx
+        else:
+            Sx = 1.0
+            Tx = Bx_
+        if Dy != 0:
+            Sy = Dy_/Dy
+            Ty = By_ - Sy*By
+        else:
+            Sy = 1.0
+            Ty = By_
+        Cx = Bx_ + Dx_/2.0
+        Cy = By_ + Dy_/2.0
+        cos_t = np.cos(theta)
+        sin_t = np.sin(theta)
+        M00 = Fx*cos_t
+        M01 = -Fy*sin_t
+        M10 = Fx*sin_t
+        M11 = Fy*cos_t
+        out[i, 0, 0] = M00*Sx
+        out[i, 0, 1] = M01*Sy
+        out[i, 0, 2] = M00*Tx + M01*Ty + Cx - (M00*Cx + M01*Cy)
+        out[i, 1, 0] = M10*Sx
+        out[i, 1, 1] = M11*Sy
+        out[i, 1, 2] = M10*Tx + M11*Ty + Cy - (M10*Cx + M11*Cy)
+        out[i, 2, 2] = 1.0
+
+__batch_transform = (njit(cache=True, fastmath=True)(__fill_drawml_matrices)
+                        if njit is not None else None)
+
+#===============================================================================
+
 class DrawMLTransform(Transform):
     def __init__(self, shape, bbox=None):
-        if bbox is None:
-            bbox = (shape.width, shape.height)
-
-        xfrm = shape.element.xfrm
-
-        # From Section L.4.7.6 of ECMA-376 Part 1
-        (Bx, By) = ((xfrm.chOff.x, xfrm.chOff.y)
-                        if xfrm.chOff is not None else
-                    (0, 0))
-        (Dx, Dy) = ((xfrm.chExt.cx, xfrm.chExt.cy)
-                        if xfrm.chExt is not None else
-                    bbox)
-        (Bx_, By_) = (xfrm.off.x, xfrm.off.y)
-        (Dx_, Dy_) = (xfrm.ext.cx, xfrm.ext.cy)
-        theta = radians(xfrm.rot)
-        Fx = -1 if xfrm.flipH else 1
-        Fy = -1 if xfrm.flipV else 1
-        T_st = np.array([[Dx_/Dx,      0, Bx_ - (Dx_/Dx)*Bx] if Dx != 0 else [1, 0, Bx_],
-                         [     0, Dy_/Dy, By_ - (Dy_/Dy)*By] if Dy != 0 else [0, 1, By_],
-                         [     0,      0,                 1]])
-        U = np.array([[1, 0, -(Bx_ + Dx_/2.0)],
-                      [0, 1, -(By_ + Dy_/2.0)],
-                      [0, 0,                1]])
-        R = np.array([[cos(theta), -sin(theta), 0],
-                      [sin(theta),  cos(theta), 0],
-                      [0,                    0, 1]])
-        Flip = np.array([[Fx,  0, 0],
-                         [ 0, Fy, 0],
-                         [ 0,  0, 1]])
-        T_rf = np.linalg.inv(U)@R@Flip@U
-        super().__init__(T_rf@T_st)
+        (Bx, By, Dx, Dy, Bx_, By_, Dx_, Dy_, theta, Fx, Fy) = drawml_parameters(shape, bbox)
+        # Scale and translate child offsets into the parent's coordinates
+        (Sx, Tx) = (Dx_/Dx, Bx_ - (Dx_/Dx)*Bx) if Dx != 0 else (1, Bx_)
+        (Sy, Ty) = (Dy_/Dy, By_ - (Dy_/Dy)*By) if Dy != 0 else (1, By_)
+        # Rotate and flip about the centre of the shape. This is ``inv(U)@R@Flip@U``,
+        # where ``U`` translates the centre to the origin, written in closed form.
+        (Cx, Cy) = (Bx_ + Dx_/2.0, By_ + Dy_/2.0)
+        (cos_t, sin_t) = (cos(theta), sin(theta))
+        (M00, M01) = (Fx*cos_t, -Fy*sin_t)
+        (M10, M11) = (Fx*sin_t,  Fy*cos_t)
+        Ex = Cx - (M00*Cx + M01*Cy)
+        Ey = Cy - (M10*Cx + M11*Cy)
+        # ``T_rf@T_st``, exploiting the sparsity of both matrices and filling
+        # entries directly rather than having numpy parse nested lists
+        T = np.empty((3, 3), dtype=np.float64)
+        T[0, 0] = M00*Sx
+        T[0, 1] = M01*Sy
+        T[0, 2] = M00*Tx + M01*Ty + Ex
+        T[1, 0] = M10*Sx
+        T[1, 1] = M11*Sy
+        T[1, 2] = M10*Tx + M11*Ty + Ey
+        T[2, 0] = 0.0
+        T[2, 1] = 0.0
+        T[2, 2] = 1.0
+        super().__init__(T)
 
 #===============================================================================
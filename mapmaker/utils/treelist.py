@@ -27,12 +27,21 @@ class TreeList(list):
         """
         Return leaves of the tree as a ``list`` in depth-first order.
         """
-        flattened = []
-        for element in self[skip:]:
-            if isinstance(element, TreeList):
-                flattened.extend(element.flatten(skip=skip))
+        return list(self.iter_leaves(skip=skip))
+
+    def iter_leaves(self, skip=0):
+        """
+        Yield leaves of the tree in depth-first order, without building
+        an intermediate list.
+        """
+        stack = [iter(self[skip:])]
+        while stack:
+            for element in stack[-1]:
+                if isinstance(element, TreeList):
+                    stack.append(iter(element[skip:]))
+                    break
+                yield element
             else:
-                flattened.append(element)
-        return flattened
+                stack.pop()
 
 #===============================================================================
@@ -72,8 +72,9 @@ class Slide(object):
             progress_bar = tqdm(total=len(shapes),
                 unit='shp', ncols=40,
                 bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt}')
+        slide_id = self.__slide_id
         for shape in shapes:
-            unique_id = '{}#{}'.format(self.__slide_id, shape.shape_id)
+            unique_id = f'{slide_id}#{shape.shape_id}'
             if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
                 shape_type = 'G'
                 self.__current_group.append(shape.name)
@@ -81,7 +82,7 @@ class Slide(object):
                 self.__current_group.pop()
             else:
                 shape_type = 'S'
-            print('{} {:10} {}'.format(shape_type, unique_id, shape.name))
+            print(f'{shape_type} {unique_id:10} {shape.name}')
 ##                self.__properties_by_id[unique_id] = self.__properties.get_properties(shape, self.__current_group[-1])
             if outermost and self.__options.verbose:
                 progress_bar.update(1)
@@ -106,9 +107,9 @@ class Presentation(object):
         self.__seen = []
         for slide_number, slide in enumerate(self.__pptx.slides):
             if options.debug_xml:
-                xml = open(os.path.join(options.output_dir, 'layer{:02d}.xml'.format(slide_number)), 'w')
-                xml.write(slide.element.xml)
-                xml.close()
+                with open(os.path.join(options.output_dir, 'layer{:02d}.xml'.format(slide_number)), 'wb',
+                          buffering=1 << 20) as xml:
+                    xml.write(slide.element.xml.encode('utf-8'))
             self.__slides_by_id[slide.slide_id] = Slide(slide, properties, options)
 
     def list(self):
@@ -22,6 +22,7 @@ import argparse
 import json
 import logging
 import pathlib
+import re
 import shutil
 import sqlite3
 import tempfile
@@ -31,6 +32,19 @@ import tempfile
 import git
 import giturlparse
 
+# Use the faster ``orjson`` for ``index.json`` files when it's available
+try:
+    import orjson
+
+    json_loads = orjson.loads
+
+    def json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+
+except ImportError:
+    json_loads = json.loads
+    json_dumps = json.dumps
+
 #===============================================================================
 
 from flatmapknowledge import KnowledgeStore
@@ -43,9 +57,11 @@ __version__ = '1.0.0'
 
 #===============================================================================
 
+# Leading zeros of a colon-separated part, leaving at least one character in the part
+LEADING_ZEROS = re.compile(r'(?<![^:])0+(?=[^:])')
+
 def normalise_identifier(id):
-    return ':'.join([(s[:-1].lstrip('0') + s[-1])
-                        for s in id.split(':')])
+    return LEADING_ZEROS.sub('', id)
 
 #===============================================================================
 
@@ -88,9 +104,12 @@ class Flatmap:
         if not flatmap_path.is_dir() or not index_file.exists() or not mbtiles.exists():
             raise FlatmapError('Invalid or missing directory')
 
+        # Only the index's version is needed to check the map, so the index
+        # itself isn't kept and is only loaded again if it is asked for
+        self.__index_file = index_file
+        self.__index = None
         with open(index_file) as fp:
-            self.__index = json.loads(fp.read())
-        version = self.__index.get('version', 1.0)
+            version = json_loads(fp.read()).get('version', 1.0)
         if version < 1.3:
             raise FlatmapError('Version is too old')
 
@@ -143,6 +162,9 @@ class Flatmap:
 
     @property
     def index(self):
+        if self.__index is None:
+            with open(self.__index_file) as fp:
+                self.__index = json_loads(fp.read())
         return self.__index
 
     def as_dict(self):
@@ -155,7 +177,7 @@ class Flatmap:
 
 def latest_flatmaps(flatmap_root):
 #=================================
-    flatmaps_by_dir = {}
+    maps_by_taxon_sex = {}
     root_path = pathlib.Path(flatmap_root).absolute()
     if not root_path.exists():
         logging.error(f'Missing source directory: {root_path}')
@@ -164,18 +186,16 @@ def latest_flatmaps(flatmap_root):
         for flatmap_path in root_path.iterdir():
             if flatmap_path.is_dir():
                 try:
-                    flatmaps_by_dir[str(flatmap_path)] = Flatmap(flatmap_path)
+                    flatmap = Flatmap(flatmap_path)
                 except FlatmapError as e:
                     logging.warning(f'{flatmap_path}: {e}')
                     continue
-    maps_by_taxon_sex = {}
-    for flatmap_dir, flatmap in flatmaps_by_dir.items():
-        if ((created := flatmap.get('created')) is not None
-        and (taxon := flatmap.get('taxon', flatmap.get('describes'))) is not None):
-            map_key = (taxon, flatmap.get('biologicalSex', ''))
-            if (map_key not in maps_by_taxon_sex
-             or created > maps_by_taxon_sex[map_key][0]):
-                maps_by_taxon_sex[map_key] = (created, flatmap_dir, flatmap)
+                if ((created := flatmap.get('created')) is not None
+                and (taxon := flatmap.get('taxon', flatmap.get('describes'))) is not None):
+                    map_key = (taxon, flatmap.get('biologicalSex', ''))
+                    if ((latest := maps_by_taxon_sex.get(map_key)) is None
+                     or created > latest[0]):
+                        maps_by_taxon_sex[map_key] = (created, str(flatmap_path), flatmap)
 
     return { flatmap_dir: flatmap for _, flatmap_dir, flatmap in maps_by_taxon_sex.values() }
 
@@ -220,7 +240,7 @@ class FlatmapConvertor:
         shutil.copytree(flatmap_dir, output_dir)
 
         with open(output_dir / 'index.json') as fp:
-            index = json.loads(fp.read())
+            index = json_loads(fp.read())
         index['id'] = manifest.id
         index['uuid'] = manifest.uuid
         index['taxon'] = manifest.models
@@ -230,7 +250,7 @@ class FlatmapConvertor:
         index['git-status'] = manifest.git_status
         index['style'] = 'flatmap'
         with open(output_dir / 'index.json', 'w') as fp:
-            fp.write(json.dumps(index))
+            fp.write(json_dumps(index))
 
         mbtiles_file = output_dir / 'index.mbtiles'
         db = MetadataDatabase(mbtiles_file)
@@ -256,13 +276,19 @@ class FlatmapConvertor:
         db.close()
 
         if self.__store.db is not None:
-            self.__store.db.execute('begin')
+            # Knowledge store updates for all converted maps are made in a
+            # single transaction, which is committed by ``close()``
+            if not self.__store.db.in_transaction:
+                self.__store.db.execute('begin')
             self.__store.db.execute('replace into flatmaps(id, models, created) values (?, ?, ?)',
                                         (manifest.uuid, manifest.models, metadata['created']))
-            self.__store.db.commit()
 
         return metadata['uuid']
 
+    def close(self):
+        if self.__store.db is not None and self.__store.db.in_transaction:
+            self.__store.db.commit()
+
 #===============================================================================
 
 def main():
@@ -316,25 +342,29 @@ def main():
             logging.error(f'Missing destination directory: {output_path}')
             exit()
         convertor = FlatmapConvertor(output_path, args.final_dest)
-        for flatmap_dir, flatmap in latest_maps.items():
-            taxon = flatmap['taxon']
-            if 'uuid' in flatmap:
-                logging.warning(f'{taxon} already has GUID in source {flatmap_dir} -- skipped processing')
-                continue
-            elif args.id is not None and args.id != flatmap['id']:
-                continue
-            logging.info(f'Processing {taxon} from source {flatmap_dir}')
-            try:
-                flatmap_source = FlatmapSource(flatmap)
-            except FlatmapError as e:
-                logging.warning(f'{flatmap_dir}: {e}')
-                continue
-            guid = convertor.convert(flatmap_dir, flatmap_source.manifest)
-            if guid is not None:
-                output_dict[taxon] = guid
-                logging.info(f'Saved {taxon} as {guid} in destination')
-            else:
-                logging.warning(f'{taxon} with GUID already exists in destination -- not overwritten')
+        # Commit knowledge store rows for maps already converted even if a later map fails
+        try:
+            for flatmap_dir, flatmap in latest_maps.items():
+                taxon = flatmap['taxon']
+                if 'uuid' in flatmap:
+                    logging.warning(f'{taxon} already has GUID in source {flatmap_dir} -- skipped processing')
+                    continue
+                elif args.id is not None and args.id != flatmap['id']:
+                    continue
+                logging.info(f'Processing {taxon} from source {flatmap_dir}')
+                try:
+                    flatmap_source = FlatmapSource(flatmap)
+                except FlatmapError as e:
+                    logging.warning(f'{flatmap_dir}: {e}')
+                    continue
+                guid = convertor.convert(flatmap_dir, flatmap_source.manifest)
+                if guid is not None:
+                    output_dict[taxon] = guid
+                    logging.info(f'Saved {taxon} as {guid} in destination')
+                else:
+                    logging.warning(f'{taxon} with GUID already exists in destination -- not overwritten')
+        finally:
+            convertor.close()
 
     print(json.dumps(output_dict, indent=4))
 
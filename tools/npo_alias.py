@@ -3,7 +3,14 @@
 import pandas as pd
 import ast
 import json
-import os
+import re
+import sys
+
+# ``orjson`` is optional but much faster than ``json`` for reading large connectivity term files
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 #===============================================================================
 
@@ -12,55 +19,142 @@ class PathError(Exception):
 
 #===============================================================================
 
+# Cells in the aligned file are Python literals, e.g. ``('ILX:0793082', ('UBERON:0002048',))``.
+# ``json.loads`` is much faster than ``ast.literal_eval`` so we first try to parse a
+# cell as JSON, falling back to ``ast.literal_eval`` for anything that isn't valid.
+
+NODE_TO_JSON = str.maketrans("()'", '[]"')
+NAMES_TO_JSON = str.maketrans("'", '"')
+TRAILING_COMMA = re.compile(r',\s*\]')
+
+def parse_node(cell):
+    # Node identifiers are CURIEs so can't contain brackets or quotes
+    try:
+        return json.loads(TRAILING_COMMA.sub(']', cell.translate(NODE_TO_JSON)))
+    except json.JSONDecodeError:
+        return ast.literal_eval(cell)
+
+def parse_names(cell):
+    # Labels may contain brackets, so only quotes are converted
+    try:
+        return json.loads(cell.translate(NAMES_TO_JSON))
+    except json.JSONDecodeError:
+        return ast.literal_eval(cell)
+
+# Equal nodes are mapped to a single canonical object, held in ``interned``, so that
+# dictionary and set lookups mostly succeed on identity rather than comparing every string.
+
+def intern_term(term):
+    # A node's term or locations may be ``None``
+    return sys.intern(term) if isinstance(term, str) else term
+
+def normalise_node(node, interned):
+    # A node is either a term or a ``(term, (location, ...))`` pair, which JSON stores as lists
+    if isinstance(node, (list, tuple)):
+        node = (intern_term(node[0]), tuple(intern_term(location) for location in node[1]))
+    return interned.setdefault(node, node)
+
+#===============================================================================
+
+# The only columns of the aligned file that are used. The file is read with
+# ``pyarrow`` when it's available.
+
+ALIGNED_COLUMNS = ['Selected', 'Align candidates', 'Node', 'Candidate name']
+
+#===============================================================================
+
 def generate_aliases(aligned_file, connectivity_term_file):
-    df_alias = pd.read_csv(aligned_file)
-    df_alias = df_alias[df_alias['Selected'].str.len() > 0]
+    try:
+        df_alias = pd.read_csv(aligned_file, engine='pyarrow', dtype_backend='pyarrow',
+                               usecols=ALIGNED_COLUMNS, dtype={'Selected': 'string[pyarrow]'})
+    except ImportError:
+        df_alias = pd.read_csv(aligned_file, usecols=ALIGNED_COLUMNS, dtype={'Selected': str})
+    selected = df_alias['Selected'].str.strip()
+    df_alias = df_alias[selected.notna() & (selected != '')]
     
-    if os.path.exists(connectivity_term_file):
-        with open(connectivity_term_file, 'r') as f:
-            connectivity_terms = json.load(f)
-    else:
+    # A ``Selected`` value of ``1`` means the alignment candidate was chosen, otherwise
+    # ``Selected`` is the curated term. Choose the column to parse for all rows at once.
+    # Rows repeat the same ids and nodes, so encode each column as integer codes
+    # and only parse and normalise its distinct values.
+    is_candidate = df_alias['Selected'] == '1'
+    id_codes, id_values = pd.factorize(df_alias['Align candidates'].where(is_candidate, df_alias['Selected']),
+                                       use_na_sentinel=False)
+    node_codes, node_values = pd.factorize(df_alias['Node'], use_na_sentinel=False)
+    interned_nodes = {}
+    parsed_nodes = {}       # The same cell text can appear in both columns
+    def parsed_node(cell):
+        node = parsed_nodes.get(cell)
+        if node is None:
+            node = parsed_nodes[cell] = normalise_node(parse_node(cell), interned_nodes)
+        return node
+    alias_ids = [parsed_node(value) for value in id_values]
+    alias_nodes = [parsed_node(value) for value in node_values]
+
+    try:
+        with open(connectivity_term_file, 'rb') as f:
+            connectivity_terms = orjson.loads(f.read()) if orjson is not None else json.load(f)
+    except FileNotFoundError:
         connectivity_terms = []
 
+    # Each term's entry is kept with a set of its aliases, for fast membership tests.
+    # Only terms named in the aligned file can change, so other terms are passed
+    # through to the output without normalising their aliases.
+    needed_ids = set(alias_ids)
     current_alias = {}
     for term in connectivity_terms:
-        term_id = (term['id'][0], tuple(term['id'][1])) if isinstance(term['id'], list) else term['id']
-        if term_id not in current_alias:
-            current_alias[term_id] = {
-                'id':term_id,
+        term_id = normalise_node(term['id'], interned_nodes)
+        if term_id in current_alias:
+            continue
+        if term_id in needed_ids:
+            aliases = [normalise_node(alias, interned_nodes) for alias in term['aliases']]
+            current_alias[term_id] = ({
+                'id': term_id,
                 'name': term.get('name', ''),
-                'aliases': [(alias[0], tuple(alias[1])) if isinstance(alias, list) else alias for alias in term['aliases']]
-            }
-
-    for idx in df_alias.index:
-        alias = df_alias.loc[idx]
-        if len(alias['Selected'].strip()) > 0:
-            alias_id = ast.literal_eval(alias['Align candidates']) if alias['Selected'] == '1' else ast.literal_eval(alias['Selected'])
-            alias_id = (alias_id[0], tuple(alias_id[1]))
-            alias_node = ast.literal_eval(alias['Node'])
-            alias_node = (alias_node[0], tuple(alias_node[1]))
-            alias_name = '/'.join(ast.literal_eval(alias['Candidate name']))  if alias['Selected'] == '1' else None
-            if alias_id in current_alias:
-                if alias_node not in current_alias[alias_id]['aliases']:
-                    current_alias[alias_id]['aliases'] += [alias_node]
-
-            else:
-                current_alias[alias_id] = {
-                    'id': alias_id,
-                    'aliases': [
-                        alias_node
-                    ]
-                }
-
-            if alias_name is not None:
-                current_alias[alias_id]['name'] = alias_name
-
+                'aliases': aliases
+            }, set(aliases))
+        else:
+            current_alias[term_id] = ({
+                'id': term_id,
+                'name': term.get('name', ''),
+                'aliases': term['aliases']
+            }, None)
+
+    # Names are only used for rows where the candidate was chosen
+    alias_names = (df_alias.loc[is_candidate, 'Candidate name'].map(parse_names).map('/'.join)
+                                                               .reindex(df_alias.index))
+
+    # Rows find their term's entry by id code, only hashing the id the first time it's seen
+    entries_by_code = [None] * len(alias_ids)
+    for id_code, node_code, candidate, alias_name in zip(id_codes, node_codes,
+                                                         is_candidate, alias_names):
+        alias_id = alias_ids[id_code]
+        alias_node = alias_nodes[node_code]
+        current = entries_by_code[id_code]
+        if current is None:
+            # Different cell text may give the same id, so look in the terms as well
+            current = entries_by_code[id_code] = current_alias.setdefault(alias_id,
+                                                    ({'id': alias_id, 'aliases': []}, set()))
+        entry, entry_aliases_set = current
+        if alias_node not in entry_aliases_set:
+            entry['aliases'].append(alias_node)
+            entry_aliases_set.add(alias_node)
+
+        if candidate:
+            entry['name'] = alias_name
+
+    # Write the array one entry at a time rather than building a list of all entries,
+    # producing the same layout as ``json.dump(entries, f, indent=4)``. ``orjson`` is
+    # only used for reading so the file's layout doesn't depend on it
     with open(connectivity_term_file, 'w') as f:
-        json.dump(list(current_alias.values()), f, indent=4)
+        separator = '[\n    '
+        for entry, _ in current_alias.values():
+            f.write(separator)
+            f.write(json.dumps(entry, indent=4).replace('\n', '\n    '))
+            separator = ',\n    '
+        f.write('\n]' if separator == ',\n    ' else '[]')
 
 def main():
     import argparse
-    import sys
 
     parser = argparse.ArgumentParser(description="Checking nodes and edges completeness in the generated flatmap")
     parser.add_argument('--aligned-file', dest='aligned_file', metavar='ALIGNED_FILE', help='Missing node alignment file that is already curated')
@@ -1,28 +1,63 @@
 #===============================================================================
 
+import argparse
+from functools import cache
 from genericpath import exists
 from pathlib import Path
 from tqdm import tqdm
 import json
 import pandas as pd
 import ast
+import sys
 
 #===============================================================================
 
 from operator import index, itemgetter
-import torch
-from sentence_transformers import SentenceTransformer, util
-from SPARQLWrapper import SPARQLWrapper2
-from xml.dom import minidom
+from lxml import etree
 import re
 import itertools
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 #===============================================================================
 
-from mapmaker import MapMaker
-from mapknowledge import KnowledgeStore
-store_npo = KnowledgeStore(npo=True)
-store_sckan = KnowledgeStore()
+# ``mapmaker``, ``mapknowledge``, ``torch``, ``sentence_transformers`` and ``SPARQLWrapper``
+# are slow to import so are only imported where they are used, after arguments are parsed
+
+# Knowledge stores are only opened when something isn't already in an artefact file
+
+@cache
+def store_npo():
+    from mapknowledge import KnowledgeStore
+    return KnowledgeStore(npo=True)
+
+@cache
+def store_sckan():
+    from mapknowledge import KnowledgeStore
+    return KnowledgeStore()
+
+#===============================================================================
+
+# Use the faster ``orjson`` for knowledge and artefact files when it's available
+try:
+    import orjson
+
+    def load_json(path):
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+
+    def save_json(obj, path, indent=False):
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)))
+
+except ImportError:
+    def load_json(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def save_json(obj, path, indent=False):
+        with open(path, 'w') as f:
+            json.dump(obj, f, indent=4 if indent else None)
 
 #===============================================================================
 
@@ -33,7 +68,20 @@ class PathError(Exception):
 
 # BIOBERT = 'gsarti/biobert-nli'
 BIOBERT = 'dmis-lab/biobert-v1.1'
-biobert_model = SentenceTransformer(BIOBERT)
+
+@cache
+def embedding_device():
+    # Embeddings are computed in half precision when a GPU is available
+    import torch
+    return ('cuda', torch.float16) if torch.cuda.is_available() else ('cpu', torch.float32)
+
+@cache
+def biobert_model():
+    # The model is large so is only loaded when embeddings are first needed
+    from sentence_transformers import SentenceTransformer
+    device, _ = embedding_device()
+    model = SentenceTransformer(BIOBERT, device=device)
+    return model.half() if device == 'cuda' else model
 
 #===============================================================================
 
@@ -41,29 +89,77 @@ biobert_model = SentenceTransformer(BIOBERT)
 
 tqdm.pandas()
 NPO_SPARQL_ENDPOINT = 'https://blazegraph.scicrunch.io/blazegraph/sparql'
-sparql_wrapper = SPARQLWrapper2(NPO_SPARQL_ENDPOINT)
+
+# Ancestors of up to four ``ilxtr:isPartOf`` levels, for a batch of terms
+ANCESTOR_QUERY_BATCH_SIZE = 100
+ANCESTOR_QUERY = """
+    SELECT DISTINCT ?curie ?parent ?label ?level
+    {{
+        VALUES (?term ?curie) {{{values}}}
+        {{
+            ?term ilxtr:isPartOf ?parent .
+            ?parent rdfs:label ?label .
+            BIND (1 as ?level)
+        }}
+        UNION
+        {{
+            ?term ilxtr:isPartOf/ilxtr:isPartOf ?parent .
+            ?parent rdfs:label ?label .
+            BIND (2 as ?level)
+        }}
+        UNION
+        {{
+            ?term ilxtr:isPartOf/ilxtr:isPartOf/ilxtr:isPartOf ?parent .
+            ?parent rdfs:label ?label .
+            BIND (3 as ?level)
+        }}
+        UNION
+        {{
+            ?term ilxtr:isPartOf/ilxtr:isPartOf/ilxtr:isPartOf/ilxtr:isPartOf ?parent .
+            ?parent rdfs:label ?label .
+            BIND (4 as ?level)
+        }}
+    }}
+"""
+ANCESTOR_QUERY_WORKERS = 4
+
+def query_ancestors(terms):
+    # a wrapper holds its query so each call uses its own, allowing batches to run in parallel
+    from SPARQLWrapper import SPARQLWrapper2
+    sparql_wrapper = SPARQLWrapper2(NPO_SPARQL_ENDPOINT)
+    sparql_wrapper.setQuery(ANCESTOR_QUERY.format(values=' '.join(f'({term} "{term}")' for term in terms)))
+    return sparql_wrapper.query().bindings
+
 namespaces = {
     'UBERON': 'http://purl.obolibrary.org/obo/UBERON_',
     'ILX': 'http://uri.interlex.org/base/ilx_',
 }
 
+# Match any namespace's URL prefix in one pass, naming the group by its namespace
+namespace_prefixes = re.compile('|'.join(f'(?P<{namespace}>{re.escape(preff)})'
+                                            for namespace, preff in namespaces.items()))
+
 def get_curie(url: str):
-    for namespace, preff in namespaces.items():
-        if url.startswith(preff):
-            return url.replace(preff, namespace + ':')
+    if (m := namespace_prefixes.match(url)) is not None:
+        return f'{m.lastgroup}:{url[m.end():]}'
     return url
 
 #===============================================================================
 
 ### Missing nodes and rendered identification
 
+# The ``id()`` of a shape given in an SVG ``<title>``
+SVG_TITLE_ID = re.compile(r'id\(([^)]*)\)')
+
+# Candidates are also searched for the phrases of a node's name
+IN_OF_SEPARATOR = re.compile(r' IN | of ')
+
 class FlatMapCheck:
     def __init__(self, args):
 
         # intialisation
         self.__manifest_file = Path(args.manifest_file)
-        with open(self.__manifest_file, 'r') as f:
-            self.__manifest = json.load(f)
+        self.__manifest = load_json(self.__manifest_file)
         self.__species = self.__manifest.get('id')
         self.__output_dir = Path(args.output_dir)/f"{self.__species}_output"
         self.__output_dir.mkdir(parents=True, exist_ok=True)
@@ -85,21 +181,31 @@ class FlatMapCheck:
         self.__map_node_name_file = self.__artefact_dir/'map_node_name.json'
         self.__map_node_name = {}
         if self.__map_node_name_file.exists():
-            with open(self.__map_node_name_file, 'r') as f:
-                self.__map_node_name = ast.literal_eval(json.load(f))
+            map_node_name = load_json(self.__map_node_name_file)
+            if isinstance(map_node_name, str):     # saved by an earlier version as a Python literal
+                self.__map_node_name = ast.literal_eval(map_node_name)
+            else:
+                self.__map_node_name = {(node[0], tuple(node[1])): (name[0], tuple(name[1]))
+                                            for node, name in map_node_name}
 
         # load knowledgebase
         self.__knowledge_file = self.__artefact_dir/'knowledgebase.json'
         self.__knowledge = {}
         if self.__knowledge_file.exists():
-            with open(self.__knowledge_file, 'r') as f:
-                self.__knowledge = json.load(f)
+            self.__knowledge = load_json(self.__knowledge_file)
 
         # get map_log of a particular AC/FC
         self.__map_log = self.__generate_flatmap()
 
         # load terms and embeddings of a particular AC/FC
         self.__terms, self.__term_embeddings = self.__load_flatmap_terms()
+        self.__term_index = {term: index for index, term in enumerate(self.__terms)}
+        self.__term_items = list(self.__terms.items())
+
+        # embeddings of labels that are compared against terms, by label
+        self.__label_embeddings = {}
+        # the closest terms to a query, by (query, k)
+        self.__search_results = {}
 
         # load already identified ancestors
         self.__map_ancestor = self.__load_ancestors()
@@ -117,18 +223,16 @@ class FlatMapCheck:
         }
         knowledge_file = self.__artefact_dir/'npo_knowledge.json'
         if knowledge_file.exists() and not self.__clean_connectivity:
-            with open(knowledge_file, 'r') as f:
-                npo_connectivities = json.load(f)
+            npo_connectivities = load_json(knowledge_file)
         else:
             npo_connectivities = {}
-            for model in store_npo.connectivity_models('NPO'):
-                conns = store_npo.entity_knowledge(model)
+            for model in store_npo().connectivity_models('NPO'):
+                conns = store_npo().entity_knowledge(model)
                 for conn in tqdm(conns['paths']):
-                    npo_connectivities[conn['id']] = store_npo.entity_knowledge(conn['id'])
+                    npo_connectivities[conn['id']] = store_npo().entity_knowledge(conn['id'])
                     conn_phenotype = tuple(sorted(npo_connectivities[conn['id']]['phenotypes']))
                     npo_connectivities[conn['id']]['phenotypes'] = phenotypes.get(conn_phenotype, str(conn_phenotype))
-            with open(knowledge_file, 'w') as f:
-                json.dump(npo_connectivities, f, indent=4)
+            save_json(npo_connectivities, knowledge_file, indent=True)
         return npo_connectivities
 
     def __generate_flatmap(self):
@@ -143,6 +247,7 @@ class FlatMapCheck:
             'logFile': log_file.as_posix(),
             'cleanConnectivity': self.__clean_connectivity
         }
+        from mapmaker import MapMaker
         mapmaker = MapMaker(options)
         mapmaker.make()
         map_log = self.__load_log_file(log_file=log_file)
@@ -159,14 +264,12 @@ class FlatMapCheck:
         terms = {}
         if self.__manifest.get('kind', '') != 'functional':
             anatomical_file = self.__manifest_file.parent/self.__manifest.get('anatomicalMap')
-            with open(anatomical_file, 'r') as f:
-                anatomical_terms = json.load(f)
+            anatomical_terms = load_json(anatomical_file)
 
             ### Loading property and stored in anatomical term
             # load property
             property_file = self.__manifest_file.parent/self.__manifest.get('properties')
-            with open(property_file, 'r') as f:
-                properties = json.load(f)
+            properties = load_json(property_file)
             # load from features key
             for key, val in properties['features'].items():
                 if (_model:=val.get('models')) is not None:
@@ -183,29 +286,25 @@ class FlatMapCheck:
                 if (_model:=network.get('models')) is not None:
                     anatomical_terms[network['id']] = {'term':network.get('models')}
 
-            ## Complete anatomical_terms with no name and check it's concistency
-            anaterms = {}
-            for term_id in tqdm(set([anaterm['term'] for anaterm in anatomical_terms.values()])):
-                if term_id not in anaterms:
-                    anaterms[term_id] = self.__get_term_label(term_id)
-
             ## Select anaterms that available in svg only
             ## Get all id used in csv file
             svg_file = self.__manifest_file.parent/(self.__manifest.get('sources')[0].get('href'))
-            doc = minidom.parse(str(svg_file))  # parseString also exists
-            svg_used_ids = [path.firstChild.nodeValue[path.firstChild.nodeValue.index('id(')+3:path.firstChild.nodeValue.index(')')].strip() for path in doc.getElementsByTagName('title') if 'id(' in path.firstChild.nodeValue]
-            doc.unlink()
+            svg_used_ids = set()
+            # Clear every element once it's been seen so the whole tree isn't kept in memory
+            for _, element in etree.iterparse(str(svg_file), events=('end',), huge_tree=True):
+                if (etree.QName(element).localname == 'title' and element.text is not None
+                and (m := SVG_TITLE_ID.search(element.text)) is not None):
+                    svg_used_ids.add(m.group(1).strip())
+                element.clear(keep_tail=True)
 
             ### Filter anaterms that only available in svg
-            # Get terms_ids and term_names
-            for idx in set(svg_used_ids) & set(anatomical_terms.keys()):
-                term_id = anatomical_terms[idx]['term']
-                if term_id not in terms:
-                    terms[term_id] = anaterms.get(term_id, term_id).lower()
+            # Get terms_ids and term_names, only looking up labels of terms used in the svg
+            term_ids = {anatomical_terms[idx]['term'] for idx in svg_used_ids.intersection(anatomical_terms)}
+            for term_id in tqdm(term_ids):
+                terms[term_id] = self.__get_term_label(term_id).lower()
         else: # handling functional connectivity
             annotation_file = self.__manifest_file.parent/self.__manifest.get('annotation','')
-            with open(annotation_file, 'r') as f:
-                annotations = json.load(f)
+            annotations = load_json(annotation_file)
             for term_type, anatomy_list in annotations.items():
                 # if term_type == 'Systems': continue
                 for anatomy in anatomy_list:
@@ -216,17 +315,42 @@ class FlatMapCheck:
                         terms[term_id] = label.lower()
 
         ## generate term embedding
-        term_embeddings = biobert_model.encode(list(terms.values()), convert_to_tensor=True)
+        term_embeddings = self.__load_term_embeddings(list(terms.values()))
         return terms, term_embeddings
 
+    def __load_term_embeddings(self, labels):
+        # term embeddings are kept between runs so only new labels need encoding
+        import torch
+        embeddings_file = self.__artefact_dir/'term_embeddings.pt'
+        embeddings = {}
+        if embeddings_file.exists():
+            saved = torch.load(embeddings_file, map_location='cpu')
+            if saved.get('model') == BIOBERT:
+                embeddings = dict(zip(saved['labels'], saved['embeddings']))
+        new_labels = [label for label in dict.fromkeys(labels) if label not in embeddings]
+        if len(new_labels) > 0:
+            embeddings.update(zip(new_labels, biobert_model().encode(new_labels, convert_to_tensor=True).float().cpu()))
+            torch.save({
+                'model': BIOBERT,
+                'labels': list(embeddings.keys()),
+                'embeddings': torch.stack(list(embeddings.values()))
+            }, embeddings_file)
+        if len(labels) == 0:
+            return torch.empty(0)
+        # normalised so that cosine similarity is a dot product
+        return torch.nn.functional.normalize(torch.stack([embeddings[label] for label in labels]),
+                                             dim=1).to(*embedding_device())
+
     def __get_term_label(self, term_id):
         if term_id in self.__knowledge:
             return self.__knowledge[term_id]
-        label = store_npo.label(term_id) # prioritise to npo
-        self.__knowledge[term_id] = store_sckan.label(term_id) if label == term_id else label
+        label = store_npo().label(term_id) # prioritise to npo
+        self.__knowledge[term_id] = store_sckan().label(term_id) if label == term_id else label
         return self.__knowledge[term_id]
 
     def __get_node_name(self, node):
+        if (node_name := self.__map_node_name.get(node)) is not None:
+            return [node_name[0], *node_name[1]]
         name = [node[0]]
         if node[0] is not None:
             name = [self.__get_term_label(node[0])]
@@ -243,65 +367,60 @@ class FlatMapCheck:
         map_ancestor_file = self.__artefact_dir/'map_ancestor.json'
         map_ancestor = {}
         if map_ancestor_file.exists():
-            with open(map_ancestor_file, 'r') as f:
-                map_ancestor = json.load(f)
+            map_ancestor = load_json(map_ancestor_file)
+        # find the terms of all connectivities not in the file, if any
+        required_terms = set()
         for conn in self.__npo_connectivities.values():
             for edge in conn['connectivity']:
-                for term in [edge[0][0]] + edge[0][1] + [edge[1][0]] + edge[1][1]:
-                    if term not in map_ancestor:
-                        sparql = f"""
-                            SELECT DISTINCT ?parent ?label ?level
-                            {{
-                                VALUES ?term {{{term}}}
-                                {{
-                                    ?term ilxtr:isPartOf ?parent .
-                                                ?parent rdfs:label ?label .
-                                    BIND (1 as ?level)
-                                }}
-                                UNION
-                                {{
-                                    ?term ilxtr:isPartOf/ilxtr:isPartOf ?parent .
-                                    ?parent rdfs:label ?label .
-                                    BIND (2 as ?level)
-                                }}
-                                UNION
-                                {{
-                                    ?term ilxtr:isPartOf/ilxtr:isPartOf/ilxtr:isPartOf ?parent .
-                                    ?parent rdfs:label ?label .
-                                    BIND (3 as ?level)
-                                }}
-                                UNION
-                                {{
-                                    ?term ilxtr:isPartOf/ilxtr:isPartOf/ilxtr:isPartOf/ilxtr:isPartOf ?parent .
-                                    ?parent rdfs:label ?label .
-                                    BIND (4 as ?level)
-                                }}
-                            }}
-                        """
-                        sparql_wrapper.setQuery(sparql)
-                        results = {}
-                        for rs in sparql_wrapper.query().bindings:
-                            if get_curie(rs['parent'].value) not in results:
-                                results[get_curie(rs['parent'].value)] = int(rs['level'].value)
-                        map_ancestor[term] = results
-        with open(map_ancestor_file, 'w') as f:
-            json.dump(map_ancestor, f)
+                required_terms.add(edge[0][0])
+                required_terms.update(edge[0][1])
+                required_terms.add(edge[1][0])
+                required_terms.update(edge[1][1])
+        required_terms.discard(None)
+        missing_terms = list(required_terms.difference(map_ancestor))
+        if len(missing_terms) == 0:
+            return map_ancestor
+        # query the ancestors of many terms at once, pairing each term with its CURIE
+        # so that results can be matched back to it
+        batches = [missing_terms[start:start+ANCESTOR_QUERY_BATCH_SIZE]
+                    for start in range(0, len(missing_terms), ANCESTOR_QUERY_BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=ANCESTOR_QUERY_WORKERS) as executor:
+            for batch, bindings in zip(batches, executor.map(query_ancestors, batches)):
+                for term in batch:
+                    map_ancestor[term] = {}
+                for rs in bindings:
+                    results = map_ancestor[rs['curie'].value]
+                    if (parent := get_curie(rs['parent'].value)) not in results:
+                        results[parent] = int(rs['level'].value)
+        save_json(map_ancestor, map_ancestor_file)
         return map_ancestor
 
     #===========================================================================
 
+    def __encode_labels(self, labels):
+        # encode labels that haven't already been encoded as a single batch
+        new_labels = [label for label in dict.fromkeys(labels) if label not in self.__label_embeddings]
+        if len(new_labels) > 0:
+            embeddings = biobert_model().encode(new_labels, batch_size=128, convert_to_tensor=True,
+                                                normalize_embeddings=True, show_progress_bar=False)
+            self.__label_embeddings.update(zip(new_labels, embeddings))
+
+    def __label_embedding(self, label):
+        if label not in self.__label_embeddings:
+            self.__encode_labels([label])
+        return self.__label_embeddings[label]
+
     def __select_ancestor(self, term, cutout=0.1, num_return=1):
         label = self.__get_term_label(term).lower()
-        label_emb = biobert_model.encode(label, convert_to_tensor=True)
+        label_emb = self.__label_embedding(label)
 
         ancestors = self.__map_ancestor.get(term, {})
-        ancestors = {k:ancestors[k] for k in set(self.__terms.keys()) & set(ancestors.keys())}
+        ancestors = {k:v for k, v in ancestors.items() if k in self.__term_index}
         if len(ancestors) > 0:
             target_terms = list(ancestors.keys())
-            target_embs = [ self.__term_embeddings[list(self.__terms.keys()).index(k)] for k in target_terms]
-            target_embs = torch.stack(target_embs)
-            cos_scores = util.cos_sim(label_emb, target_embs)[0]
-            top_results = torch.topk(cos_scores, k=len(target_embs))
+            target_embs = self.__term_embeddings[[self.__term_index[k] for k in target_terms]]
+            cos_scores = target_embs @ label_emb
+            top_results = cos_scores.topk(k=len(target_embs))
             results = []
             for score, idx in zip(top_results[0], top_results[1]):
                 if score < cutout:
@@ -350,25 +469,24 @@ class FlatMapCheck:
         connectivity_terms_file = self.__manifest_file.parent/self.__manifest.get('connectivityTerms','None')
         connectivity_terms = []
         if connectivity_terms_file.exists():
-            with open(connectivity_terms_file, 'r') as f:
-                connectivity_terms = json.load(f)
+            connectivity_terms = load_json(connectivity_terms_file)
 
         # update df_missing, upadate with parents stated in connectivity_terms
+        # where a node doesn't have one, with the first term listing a node as an alias winning
+        alias_parents = {}
         for term in connectivity_terms:
             parent_id = (term['id'][0], tuple(term['id'][1])) if isinstance(term['id'], list) else term['id']
-            for term_id in [(alias[0], tuple(alias[1])) if isinstance(alias, list) else alias for alias in term['aliases']]:
-                m = df_missing.Node == term_id
-                if df_missing[m].parents.isna().any():
-                    df_missing.loc[m, 'parents'] = pd.Series([parent_id]*m.sum(), index=m[m].index)
+            for alias in term['aliases']:
+                alias_parents.setdefault((alias[0], tuple(alias[1])) if isinstance(alias, list) else alias, parent_id)
+        df_missing['parents'] = df_missing['parents'].where(df_missing['parents'].notna(),
+                                                            df_missing['Node'].map(alias_parents.get))
 
         # save new connectivity_terms
-        current_alias = {}
-        for idx in df_missing[df_missing.parents.notna()].index:
-            parents = df_missing.loc[idx].parents
-            parent_node = (parents[0], tuple(parents[1]))
-            if parent_node not in current_alias:
-                current_alias[parent_node] = []
-            current_alias[parent_node] += [df_missing.loc[idx].Node]
+        # nodes are unique in df_missing so a parent's aliases don't need de-duplicating
+        current_alias = defaultdict(list)
+        df_parents = df_missing[df_missing.parents.notna()]
+        for parents, node in zip(df_parents['parents'], df_parents['Node']):
+            current_alias[(parents[0], tuple(parents[1]))].append(node)
 
         current_alias = [
             {
@@ -379,20 +497,26 @@ class FlatMapCheck:
             for node_name, aliases in current_alias.items()
         ]        
 
-        with open(self.__output_dir/'connectivity_terms.json', 'w') as f:
-            json.dump(current_alias, f, indent=4)
+        save_json(current_alias, self.__output_dir/'connectivity_terms.json', indent=True)
 
         return df_missing
 
+    def __search_terms(self, queries, k=5):
+        # find the top k terms of all new queries with one similarity matrix
+        queries = [query for query in dict.fromkeys(queries) if (query, k) not in self.__search_results]
+        if len(queries) > 0:
+            import torch
+            query_embs = torch.stack([self.__label_embedding(query) for query in queries])
+            top_scores, top_indices = (query_embs @ self.__term_embeddings.T).topk(k=k, dim=1)
+            for query, scores, indices in zip(queries, top_scores.tolist(), top_indices.tolist()):
+                self.__search_results[(query, k)] = [(*self.__term_items[idx], score)
+                                                        for score, idx in zip(scores, indices)]
+
     def __search_term(self, query, k=5):
         query = query.lower()
-        query_emb = biobert_model.encode(query, convert_to_tensor=True)
-        cos_scores = util.cos_sim(query_emb, self.__term_embeddings)[0]
-        top_results = torch.topk(cos_scores, k=k)
-        results = []
-        for score, idx in zip(top_results[0], top_results[1]):
-            results += [(list(self.__terms.keys())[idx], list(self.__terms.values())[idx], score.item())]
-        return results
+        if (query, k) not in self.__search_results:
+            self.__search_terms([query], k)
+        return self.__search_results[(query, k)]
 
     def __get_candidates(self, name, k):
         candidates = [[st] for st in self.__search_term(name, k)]
@@ -402,9 +526,10 @@ class FlatMapCheck:
             term_candidates = [self.__search_term(phrase, k) for phrase in phrases]
             phrase_candidates = list(itertools.product(*term_candidates))
 
+        # only split at `` of `` when that gives different phrases
         of_candidates = []
-        if len(phrases:= re.split(r' IN | of ',name)) > 1:
-            term_candidates = [self.__search_term(phrase, k) for phrase in phrases]
+        if len(of_phrases := IN_OF_SEPARATOR.split(name)) > 1 and of_phrases != phrases:
+            term_candidates = [self.__search_term(phrase, k) for phrase in of_phrases]
             of_candidates = list(itertools.product(*term_candidates))
 
         nodes = []
@@ -428,9 +553,18 @@ class FlatMapCheck:
 
     def __align_missing_nodes(self, df_missing, missing_file, k):
         ### load missing NPO nodes in flatmap
+        # encode every phrase that is searched for at once
+        phrases = [phrase.lower() for name in df_missing['Node Name']
+                        for phrase in [name] + name.split(' IN ') + IN_OF_SEPARATOR.split(name)]
+        self.__encode_labels(phrases)
+        self.__search_terms(phrases, k)
         df_missing['Align candidates'] = df_missing['Node Name'].apply(lambda x: self.__get_candidates(x, k))
         df_missing = df_missing.explode('Align candidates')
-        df_missing[['Align candidates', 'Candidate name', 'Score']] = df_missing['Align candidates'].apply(pd.Series)
+        # split candidates into columns in one step, nodes without candidates have an empty row
+        candidate_columns = ['Align candidates', 'Candidate name', 'Score']
+        df_missing[candidate_columns] = pd.DataFrame([candidate if isinstance(candidate, list) else [None]*3
+                                                        for candidate in df_missing['Align candidates']],
+                                                     columns=candidate_columns, index=df_missing.index)
         df_missing['Selected'] = ''
         df_missing['Note'] = ''
         df_missing.to_csv(missing_file)
@@ -444,15 +578,16 @@ class FlatMapCheck:
                 nodes_to_neuron_types[node] = nodes_to_neuron_types.get(node, []) + [k]
 
         print('Organising missing nodes')
-        df = pd.DataFrame(columns=['Node', 'Node Name', 'Appear in'])
+        rows = []
         for node, k_types in tqdm(nodes_to_neuron_types.items()):
             name = self.__get_node_name(node)
             name = ' IN '.join(name)
-            df.loc[len(df)] = [
+            rows.append([
                 node,
                 name,
-                '\n'.join(list(set(k_types)))
-            ]
+                '\n'.join(set(k_types))
+            ])
+        df = pd.DataFrame(rows, columns=['Node', 'Node Name', 'Appear in'])
         df = df.sort_values('Appear in')
         return df
 
@@ -461,10 +596,12 @@ class FlatMapCheck:
         missing_nodes = {} # node:label
         missing_segments = {} # neuron_path:segment
         map_log = {}
+        tag_feature = 'Cannot find feature for connectivity node '
+        tag_segment = 'Cannot find any sub-segments of centreline for '
         with open(log_file, 'r') as f:
             while line := f.readline():
-                tag_feature = 'Cannot find feature for connectivity node '
-                tag_segment = 'Cannot find any sub-segments of centreline for '
+                if 'Cannot find ' not in line:  # most lines are neither
+                    continue
                 if tag_feature in line:
                     feature = line.split(tag_feature)[-1].split(') (')
                     missing_nodes[ast.literal_eval(f'{feature[0]})')] = f'({feature[1]}'.strip()
@@ -476,22 +613,26 @@ class FlatMapCheck:
             map_log[path_id] = {}
             nodes, edges = set(), set()
             m_edges = set()
+            path_segments = set(missing_segments.get(path_id, []))
             for edge in connectivities['connectivity']:
                 node_0 = (edge[0][0], tuple(edge[0][1]))
                 node_1 = (edge[1][0], tuple(edge[1][1]))
-                flat_nodes = set([edge[0][0]] + list(edge[0][1]) + [edge[1][0]] + list(edge[1][1]))
                 nodes.add(node_0)
                 nodes.add(node_1)
-                edges.add((node_0, node_1))
+                edges.add(node_edge := (node_0, node_1))
 
                 # check if nodes are in the missing list
                 if node_0 in missing_nodes or node_1 in missing_nodes:
-                    m_edges.add((node_0, node_1))
+                    m_edges.add(node_edge)
                 # check if edge contain missing segment
-                if len(set(missing_segments.get(path_id, [])) & flat_nodes) > 1:
-                    m_edges.add((node_0, node_1))
-            m_nodes = nodes & set(missing_nodes.keys())
-            r_nodes = nodes - set(missing_nodes.keys())
+                elif path_segments:
+                    flat_nodes = {node_0[0], node_1[0]}
+                    flat_nodes.update(node_0[1])
+                    flat_nodes.update(node_1[1])
+                    if len(path_segments & flat_nodes) > 1:
+                        m_edges.add(node_edge)
+            m_nodes = nodes.intersection(missing_nodes)
+            r_nodes = nodes.difference(missing_nodes)
             r_edges = edges - m_edges
             complete = 'Complete' if len(m_nodes)==0 and len(m_edges)==0 else 'Partial'
             map_log[path_id] = {
@@ -510,7 +651,7 @@ class FlatMapCheck:
     def __organised_map_log(self):
         # a function to organised data into dataframe and then save it as csv file
         ### complete neuron:
-        df = pd.DataFrame(columns=['Neuron NPO', 'Completeness', 'Missing Nodes', 'Missing Node Name', 'Missing Edges', 'Missing Edge Name', 'Missing Segments', 'Missing Segment Name', 'Rendered Edges', 'Rendered Edge Name'])
+        rows = []
         keys = [
             'missing_nodes',
             'missing_edges',
@@ -535,8 +676,9 @@ class FlatMapCheck:
                 else:
                     names = ''
                 info[key+'_name'] = '\n'.join([str(mnn) for mnn in names])
-            df.loc[len(df)] = [neuron, value['completeness']] + list(info.values())
+            rows.append([neuron, value['completeness']] + list(info.values()))
 
+        df = pd.DataFrame(rows, columns=['Neuron NPO', 'Completeness', 'Missing Nodes', 'Missing Node Name', 'Missing Edges', 'Missing Edge Name', 'Missing Segments', 'Missing Segment Name', 'Rendered Edges', 'Rendered Edge Name'])
         df = df.sort_values('Completeness')
         return df
 
@@ -547,6 +689,11 @@ class FlatMapCheck:
         # identify the missing node general terms when is align_general
         df_missing['parents'] = None
         if self.__align_general:
+            # encode the labels of all terms whose ancestors will be selected at once
+            self.__encode_labels(self.__get_term_label(term).lower()
+                                    for node in df_missing['Node']
+                                        for term in ([node[0]] if node[0] not in self.__terms else []) + list(node[1])
+                                            if term is not None)
             df_missing['parents'] = df_missing['Node'].progress_apply(lambda x: self.__parents(x))
 
         # update and merge identified parent with the existing connectivity_terms
@@ -566,39 +713,46 @@ class FlatMapCheck:
         rendered_file = self.__output_dir/f'npo_{self.__species}_rendered.csv'
         df_rendered.to_csv(f'{rendered_file}', index=False)
 
-        with open(self.__map_node_name_file, 'w') as f:
-            json.dump(str(self.__map_node_name), f)
+        save_json(list(self.__map_node_name.items()), self.__map_node_name_file)
 
-        with open(self.__knowledge_file, 'w') as f:
-            json.dump(self.__knowledge, f)
+        save_json(self.__knowledge, self.__knowledge_file)
 
 #===============================================================================
 
-def main():
-    import argparse
-    import sys
+def run(args):
+    # check a flatmap using already parsed arguments, e.g. when checking many maps from Python
+    flatmap_check = FlatMapCheck(args)
+    flatmap_check.check_npo_in_flatmap()
 
+@cache
+def build_parser():
+    # the parser is only built once when main() is called repeatedly
     parser = argparse.ArgumentParser(description="Checking nodes and edges completeness in the generated flatmap")
     parser.add_argument('--manifest', dest='manifest_file', metavar='MANIFEST', help='Path of flatmap manifest')
     parser.add_argument('--artefact-dir', dest='artefact_dir', metavar='ARTEFACT_DIR', help='Directory to store artefact files, e.g. generated maps and log file, to check NPO completeness')
     parser.add_argument('--output-dir', dest='output_dir', metavar='OUTPUT_DIR', help='Directory to store the check results')
     parser.add_argument('--clean-connectivity', dest='clean_connectivity', action='store_true', help='Run mapmaker as a clean connectivity (optional)')
     parser.add_argument('--align-general-term', dest='align_general', action='store_true', help='Find general terms of the missing nodes to align. This is useful for FC alignment')
-    parser.add_argument('--k', dest='k', help='The number of generated candidates for earch missing nodes', default=5)
+    parser.add_argument('--k', dest='k', type=int, help='The number of generated candidates for earch missing nodes', default=5)
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
 
     try:
-        args = parser.parse_args()
-        flatmap_ckeck = FlatMapCheck(args)
-        flatmap_ckeck.check_npo_in_flatmap()
+        args = parser.parse_args(argv)
+        if args.k <= 0:
+            parser.error('--k must be greater than 0')
+        run(args)
     except PathError as error:
         sys.stderr.write(f'{error}\n')
-        sys.exit(1)
-    sys.exit(0)
+        return 1
+    return 0
 
 #===============================================================================
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
 
 #===============================================================================
 